@@ -0,0 +1,76 @@
+"""
+Tests de regresion para scripts/validate_heuristics.py
+
+Los scores y senales esperados se obtuvieron con la version original de
+analyze_url_heuristic() (urlparse y una verificacion por senal). La version
+con mascaras de bits y la vectorizada de score_urls() deben reproducirlos.
+"""
+
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "scripts"))
+from validate_heuristics import SIGNAL_BITS, analyze_url_heuristic, score_urls
+
+
+# (url, score, senales en el orden en que las reporta analyze_url_heuristic)
+CASES = [
+    ("https://www.google.com", 0, []),
+    ("https://www.paypal.com/signin", 10, ["SUSPICIOUS_WORDS"]),
+    ("http://paypal-secure-login.xyz/verify/account", 80,
+     ["NO_HTTPS", "HIGH_ENTROPY", "RISKY_TLD", "SUSPICIOUS_WORDS", "BRAND_IMPERSONATION"]),
+    ("https://paypa1.com/login", 35, ["SUSPICIOUS_WORDS", "TYPOSQUATTING"]),
+    ("http://192.168.10.5/admin/login.php", 35, ["NO_HTTPS", "IP_AS_HOST", "SUSPICIOUS_WORDS"]),
+    ("https://xn--pypal-4ve.com/", 20, ["PUNYCODE_DETECTED"]),
+    ("https://a.b.c.d.e.example.tk/", 20, ["EXCESSIVE_SUBDOMAINS", "RISKY_TLD"]),
+    ("http://bit.ly/3xYz9Q", 20, ["NO_HTTPS", "URL_SHORTENER"]),
+    ("https://user@evil-site.com/bank", 20, ["AT_SYMBOL", "SUSPICIOUS_WORDS"]),
+    ("http://secure-update-account-verify-login.info/" + "x" * 80, 60,
+     ["NO_HTTPS", "LONG_URL", "MANY_HYPHENS", "HIGH_ENTROPY", "RISKY_TLD", "SUSPICIOUS_WORDS"]),
+    ("http://123456789.12345.com/9876543210", 10, ["NO_HTTPS", "HIGH_DIGIT_RATIO"]),
+    ("https://qzxwvkjhgfdsplmn0987.top/", 20, ["HIGH_ENTROPY", "RISKY_TLD"]),
+    ("https://amazon.com.account-update.online/confirm?id=1", 55,
+     ["RISKY_TLD", "SUSPICIOUS_WORDS", "BRAND_IMPERSONATION"]),
+    ("https://accounts.google.com.evil.ml/", 45,
+     ["RISKY_TLD", "SUSPICIOUS_WORDS", "BRAND_IMPERSONATION"]),
+    ("HTTPS://WWW.NETFLIX.COM/Login", 5, ["SUSPICIOUS_WORDS"]),
+    ("https://www.microsoft.com.co/", 45, ["URL_SHORTENER", "BRAND_IMPERSONATION"]),
+    # URLs malformadas o sin scheme:// (pasan por el fallback de urlparse)
+    ("paypal.com/login", 10, ["SUSPICIOUS_WORDS"]),
+    ("  http://bit.ly/abc  ", 20, ["NO_HTTPS", "URL_SHORTENER"]),
+    ("http://[::1]/login", 10, ["NO_HTTPS", "SUSPICIOUS_WORDS"]),
+    ("http://[malformed/login", 0, []),
+    ("http://exámple-paypal.com/verify", 15, ["NO_HTTPS", "SUSPICIOUS_WORDS"]),
+    ("http://a.com/x\tlogin", 10, ["NO_HTTPS", "SUSPICIOUS_WORDS"]),
+    ("javascript:alert(1)", 0, []),
+    ("", 0, []),
+    ("nan", 0, []),
+]
+
+
+@pytest.mark.parametrize("url,score,signal_ids", CASES)
+def test_analyze_url_heuristic_regression(url, score, signal_ids):
+    """Test que el analisis por URL conserva score y senales originales."""
+    result, signals = analyze_url_heuristic(url)
+    assert result == score
+    assert [signal["id"] for signal in signals] == signal_ids
+
+
+def test_score_urls_matches_regression():
+    """Test que la version vectorizada da los mismos scores y senales."""
+    scores, masks = score_urls(pd.Series([url for url, _, _ in CASES]))
+
+    assert scores.tolist() == [score for _, score, _ in CASES]
+    for mask, (url, _, signal_ids) in zip(masks, CASES):
+        found = {name for name, bit in SIGNAL_BITS.items() if mask & bit}
+        assert found == set(signal_ids), url
+
+
+def test_score_urls_missing_url():
+    """Test que una URL vacia del CSV (NaN) se puntua como el texto 'nan'."""
+    scores, masks = score_urls(pd.Series([None, "http://bit.ly/x"]))
+    assert scores.tolist() == [0, 20]
+    assert masks[0] == 0
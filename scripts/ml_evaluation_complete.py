@@ -29,12 +29,13 @@ import logging
 import warnings
 from pathlib import Path
 from datetime import datetime
+from multiprocessing import Pool
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import matplotlib
-matplotlib.use('Agg')  # Backend sin GUI
+matplotlib.use('Agg')  # Backend sin GUI (antes de importar pyplot, tambien en workers)
+import matplotlib.pyplot as plt
 
 from sklearn.model_selection import (
     train_test_split, StratifiedKFold, cross_val_score, cross_validate
@@ -457,6 +458,35 @@ def plot_feature_importance(importance_df, model_name):
     logger.info(f"  Guardado: {FIGURES_DIR / 'feature_importance.png'}")
 
 
+def _render(job):
+    """Despacha un trabajo de graficacion (ejecutado en un proceso del pool)."""
+    kind, *args = job
+
+    if kind == 'roc':
+        plot_roc_curves(*args)
+    elif kind == 'comparison':
+        plot_model_comparison(*args)
+    elif kind == 'importance':
+        plot_feature_importance(*args)
+    elif kind == 'cm':
+        plot_confusion_matrix(*args)
+
+
+def generate_all_figures(final_results, y_test, cv_results, importance_df, best_model_name):
+    """Genera todas las figuras en paralelo (cada PNG es independiente)."""
+    jobs = [
+        ('roc', final_results, y_test),
+        ('comparison', cv_results),
+        *[('cm', r['confusion_matrix'], n) for n, r in final_results.items()]
+    ]
+    if importance_df is not None:
+        jobs.append(('importance', importance_df, best_model_name))
+
+    logger.info(f"Generando {len(jobs)} figuras en paralelo...")
+    with Pool(4) as p:
+        p.map(_render, jobs)
+
+
 def generate_markdown_report(cv_results, final_results, best_model_name, dataset_info):
     """Genera reporte en formato Markdown para la tesis."""
     logger.info("Generando reporte Markdown...")
@@ -652,17 +682,11 @@ def main():
         X_train, X_val, X_test, y_train, y_val, y_test, models
     )
 
-    # Generar graficos
-    plot_roc_curves(final_results, y_test)
-    plot_model_comparison(cv_results)
-
-    for name, results in final_results.items():
-        plot_confusion_matrix(results['confusion_matrix'], name)
-
     # Feature importance
     importance_df = get_feature_importance(best_model, best_model_name, FEATURE_COLUMNS)
-    if importance_df is not None:
-        plot_feature_importance(importance_df, best_model_name)
+
+    # Generar graficos
+    generate_all_figures(final_results, y_test, cv_results, importance_df, best_model_name)
 
     # Generar reporte Markdown
     generate_markdown_report(cv_results, final_results, best_model_name, dataset_info)
@@ -3,15 +3,27 @@
 Test de integracion completa con Tranco API
 """
 
+import sys
 import pickle
-import pandas as pd
+import warnings
+import numpy as np
 import requests
 import time
 import re
 import math
+from pathlib import Path
 from urllib.parse import urlparse, parse_qs
 from collections import Counter
 from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import StandardScaler
+
+# Cache SQLite compartido con el script de entrenamiento
+sys.path.insert(0, str(Path(__file__).parent))
+from train_model_v2 import SQLiteCache
 
 # ========== CONFIGURACION ==========
 # Obtener API key de variable de entorno
@@ -19,6 +31,10 @@ import os
 TRANCO_API_KEY = os.environ.get('TRANCO_API_KEY', 'tu-api-key-aqui')
 TRANCO_BASE_URL = 'https://tranco-list.eu/api'
 
+# Cache persistente de rankings (compartido entre ejecuciones)
+CACHE_DIR = Path(__file__).parent.parent / 'cache'
+TRANCO_CACHE_TTL = 7 * 86400  # 7 dias
+
 # Listas actualizadas
 SUSPICIOUS_WORDS = [
     'login', 'signin', 'verify', 'update', 'secure', 'account', 'bank',
@@ -30,22 +46,22 @@ SUSPICIOUS_WORDS = [
     'full-version', 'license-key', 'product-key', 'activation', 'bypass'
 ]
 
-SHORTENERS = [
+SHORTENERS = frozenset({
     'bit.ly', 'tinyurl.com', 'goo.gl', 't.co', 'ow.ly', 'is.gd', 'buff.ly',
     'adf.ly', 'bit.do', 'mcaf.ee', 'su.pr', 'yourls.org', 'rebrand.ly',
     'kutt.it', 'tinyplease.com', 'shorturl.at', 'tiny.cc', 'bc.vc', 'j.mp',
     'v.gd', 'x.co', 'u.to', 'cutt.ly', 'rb.gy', 'clck.ru', 'shorturl.asia'
-]
+})
 
-PASTE_SERVICES = [
+PASTE_SERVICES = frozenset({
     'pastebin.com', 'paste.ee', 'pastecode.io', 'dpaste.org', 'hastebin.com',
     'ghostbin.com', 'rentry.co', 'rentry.org', 'privatebin.net', 'justpaste.it'
-]
+})
 
-RISKY_TLDS = [
+RISKY_TLDS = frozenset({
     'xyz', 'top', 'club', 'online', 'site', 'website', 'space', 'tech',
     'info', 'biz', 'cc', 'tk', 'ml', 'ga', 'cf', 'gq', 'pw', 'ws'
-]
+})
 
 OFFICIAL_DOMAINS = {
     'paypal': 'paypal.com', 'amazon': 'amazon.com', 'apple': 'apple.com',
@@ -55,6 +71,20 @@ OFFICIAL_DOMAINS = {
 
 
 # ========== FUNCIONES ==========
+_MISS = object()
+
+# Sesion HTTP reutilizada (keep-alive) con reintentos y backoff exponencial
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504))
+))
+
+_DIGIT_TRANS = str.maketrans('', '', '0123456789')
+_SPECIAL_TRANS = str.maketrans('', '', '!#$%&*+=?^_`{|}~')
+
+
 def calculate_entropy(text):
     if not text:
         return 0.0
@@ -63,15 +93,26 @@ def calculate_entropy(text):
     return -sum((c/length) * math.log2(c/length) for c in counter.values() if c > 0)
 
 
+@lru_cache(maxsize=1)
+def get_tranco_cache():
+    """Abre el cache de rankings en disco la primera vez que se consulta."""
+    return SQLiteCache(CACHE_DIR / 'tranco.sqlite', TRANCO_CACHE_TTL)
+
+
 @lru_cache(maxsize=100)
 def get_tranco_rank(domain):
+    cached = get_tranco_cache().get(domain, _MISS)
+    if cached is not _MISS:
+        return cached  # Sin rate limit: la respuesta viene del disco
+
     try:
         time.sleep(1.1)  # Rate limit
-        r = requests.get(f'{TRANCO_BASE_URL}/ranks/domain/{domain}', timeout=10)
+        r = _SESSION.get(f'{TRANCO_BASE_URL}/ranks/domain/{domain}', timeout=10)
         if r.status_code == 200:
             ranks = r.json().get('ranks', [])
-            if ranks:
-                return ranks[0].get('rank')
+            rank = ranks[0].get('rank') if ranks else None
+            get_tranco_cache().set(domain, rank)
+            return rank
     except Exception as e:
         print(f"    [Tranco Error: {e}]")
     return None
@@ -88,7 +129,10 @@ def extract_features_full(url):
     features['url_length'] = len(url)
     features['domain_length'] = len(domain)
     features['path_length'] = len(path)
-    features['num_digits'] = sum(c.isdigit() for c in url)
+    if url.isascii():
+        features['num_digits'] = len(url) - len(url.translate(_DIGIT_TRANS))
+    else:
+        features['num_digits'] = sum(c.isdigit() for c in url)
     features['num_hyphens'] = url.count('-')
     features['num_dots'] = url.count('.')
     features['num_subdomains'] = max(0, domain.count('.') - 1)
@@ -98,8 +142,10 @@ def extract_features_full(url):
     features['has_at_symbol'] = 1 if '@' in url else 0
     features['contains_ip'] = 1 if re.match(r'^(\d{1,3}\.){3}\d{1,3}$', domain.split(':')[0]) else 0
     features['has_punycode'] = 1 if 'xn--' in domain else 0
-    features['shortener_detected'] = 1 if any(s in domain for s in SHORTENERS) else 0
-    features['paste_service_detected'] = 1 if any(p in domain for p in PASTE_SERVICES) else 0
+    # Dominio registrado (ultimas dos etiquetas): bit.ly-phish.com no es bit.ly
+    domain_suffix = '.'.join(domain.split(':')[0].split('.')[-2:])
+    features['shortener_detected'] = 1 if domain_suffix in SHORTENERS else 0
+    features['paste_service_detected'] = 1 if domain_suffix in PASTE_SERVICES else 0
 
     url_lower = url.lower()
     features['has_suspicious_words'] = min(sum(1 for w in SUSPICIOUS_WORDS if w in url_lower), 5)
@@ -109,7 +155,7 @@ def extract_features_full(url):
     features['excessive_subdomains'] = 1 if features['num_subdomains'] > 3 else 0
     features['digit_ratio'] = features['num_digits'] / len(url) if url else 0
     features['num_params'] = len(parse_qs(query)) if query else 0
-    features['special_chars'] = sum(1 for c in url if c in '!#$%&*+=?^_`{|}~')
+    features['special_chars'] = len(url) - len(url.translate(_SPECIAL_TRANS))
 
     # Features de Tranco (ONLINE)
     domain_clean = domain[4:] if domain.startswith('www.') else domain
@@ -145,12 +191,62 @@ def extract_features_full(url):
     return features
 
 
+def _sigmoid(z):
+    # Forma estable para z muy negativos (evita OverflowError en math.exp)
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
+
+
+def make_fast_predictor(pipeline):
+    """
+    Devuelve f(x) -> probabilidad de phishing para un vector de features.
+
+    Para StandardScaler + LogisticRegression el escalado se pliega en los
+    coeficientes y cada prediccion es un producto punto. Para otros
+    estimadores se llama directamente al clasificador, sin la validacion
+    del Pipeline por fila.
+    """
+    if hasattr(pipeline, 'steps'):
+        preprocess = pipeline[:-1]
+        clf = pipeline.steps[-1][1]
+        steps = [step for _, step in preprocess.steps]
+    else:
+        # Modelos de arboles guardados sin Pipeline (no llevan escalado)
+        preprocess, clf, steps = None, pipeline, []
+
+    if isinstance(clf, LogisticRegression) and clf.coef_.shape[0] == 1 and \
+            all(isinstance(step, StandardScaler) for step in steps):
+        w = clf.coef_[0].astype(np.float64)
+        b = float(clf.intercept_[0])
+        for scaler in reversed(steps):
+            # ((x - mu) / sd) @ w + b  ==  x @ (w / sd) + (b - mu @ (w / sd))
+            if scaler.scale_ is not None:
+                w = w / scaler.scale_
+            if scaler.with_mean:
+                b -= float(scaler.mean_ @ w)
+        return lambda x: _sigmoid(float(x @ w) + b)
+
+    def predict(x):
+        X = x.reshape(1, -1)
+        # El pipeline se entreno con un DataFrame; aqui se le pasa un ndarray
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', message='X does not have valid feature names')
+            if steps:
+                X = preprocess.transform(X)
+            return clf.predict_proba(X)[0, 1]
+
+    return predict
+
+
 def main():
     # Cargar modelo
     with open('models/step1_baseline.pkl', 'rb') as f:
         model_data = pickle.load(f)
     pipeline = model_data['pipeline']
     feature_names = model_data['feature_names']
+    predict_proba = make_fast_predictor(pipeline)
 
     # URLs de prueba
     test_urls = [
@@ -171,8 +267,10 @@ def main():
         print(f'Esperado: {descripcion}')
 
         features = extract_features_full(url)
-        X = pd.DataFrame([features])[feature_names]
-        prob = pipeline.predict_proba(X)[0, 1]
+        X_row = np.fromiter(
+            (features[k] for k in feature_names), dtype=np.float32, count=len(feature_names)
+        )
+        prob = predict_proba(X_row)
         score = int(prob * 100)
 
         if score <= 30:
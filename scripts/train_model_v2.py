@@ -18,28 +18,41 @@ import os
 import sys
 import json
 import pickle
+import sqlite3
 import logging
 import re
 import math
+import mmap
 import random
+import base64
 import hashlib
+import itertools
+import shutil
 import time
-import requests
+import asyncio
+import aiohttp
 from pathlib import Path
 from datetime import datetime
-from urllib.parse import urlparse, parse_qs
-from collections import Counter
+from urllib.parse import urlparse, parse_qs, uses_params
+from functools import lru_cache
 from typing import List, Dict, Tuple, Optional
 
 import pandas as pd
 import numpy as np
+from joblib import Parallel, delayed, parallel_config
 from sklearn.linear_model import LogisticRegression
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
+from sklearn.ensemble import RandomForestClassifier, HistGradientBoostingClassifier
 from sklearn.preprocessing import StandardScaler
 from sklearn.pipeline import Pipeline
-from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.base import ClassifierMixin
+from sklearn.model_selection import train_test_split, cross_val_score, StratifiedKFold
 from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
 
+try:
+    import ahocorasick  # pyahocorasick (opcional): búsqueda multi-patrón en C
+except ImportError:
+    ahocorasick = None
+
 # Configuracion de logging
 logging.basicConfig(
     level=logging.INFO,
@@ -55,6 +68,11 @@ MODELS_DIR = PROJECT_ROOT / "models"
 BUENOS_DATOS_DIR = PROJECT_ROOT / "Buenos_Datos"
 DATOS_MALOS_DIR = PROJECT_ROOT / "Datos_Malos"
 DATOS_ENTRENADOS_DIR = PROJECT_ROOT / "datos_ya_entrenados_pushing"
+CACHE_DIR = PROJECT_ROOT / "cache"
+
+# Entropía (escalar y vectorizada) compartida con el script de entrenamiento del paso 1
+sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+from train_step1 import calculate_entropy, entropy_batch
 
 # Cargar API keys desde .env
 from dotenv import load_dotenv
@@ -63,6 +81,17 @@ load_dotenv(PROJECT_ROOT / ".env")
 VIRUSTOTAL_API_KEY = os.getenv("VIRUSTOTAL_API_KEY", "")
 TRANCO_API_KEY = os.getenv("TRANCO_API_KEY", "")
 
+# Límite de peticiones por minuto de VirusTotal (4 API gratuita, 1000 premium)
+VIRUSTOTAL_RPM = int(os.getenv("VIRUSTOTAL_RPM", "4"))
+VIRUSTOTAL_MAX_CONCURRENCY = 64
+VIRUSTOTAL_CACHE_TTL = 86400  # 1 día
+
+# Paralelismo del entrenamiento: un proceso por fold de validación cruzada y
+# el resto de núcleos para el RandomForest de cada fold (sin sobresuscripción)
+CV_FOLDS = 5
+CV_JOBS = min(CV_FOLDS, os.cpu_count() or 1)
+ESTIMATOR_JOBS = max(1, (os.cpu_count() or 1) // CV_JOBS)
+
 # ============================================================================
 # LISTAS Y CONSTANTES
 # ============================================================================
@@ -77,21 +106,98 @@ SUSPICIOUS_WORDS = [
     'full-version', 'license-key', 'product-key', 'activation', 'bypass'
 ]
 
-SHORTENERS = [
+SHORTENERS = frozenset({
     'bit.ly', 'tinyurl.com', 'goo.gl', 't.co', 'ow.ly', 'is.gd', 'buff.ly',
     'adf.ly', 'bit.do', 'mcaf.ee', 'cutt.ly', 'rb.gy', 'shorturl.at'
-]
+})
 
-PASTE_SERVICES = [
+PASTE_SERVICES = frozenset({
     'pastebin.com', 'paste.ee', 'pastecode.io', 'dpaste.org',
     'hastebin.com', 'ghostbin.com', 'rentry.co', 'justpaste.it'
-]
+})
 
-RISKY_TLDS = [
+RISKY_TLDS = frozenset({
     'xyz', 'top', 'club', 'online', 'site', 'website', 'space', 'tech',
     'info', 'biz', 'cc', 'tk', 'ml', 'ga', 'cf', 'gq', 'pw', 'ws'
+})
+
+# Versión del extractor de features: cambiarla invalida el cache de datasets
+FEATURE_EXTRACTOR_VERSION = "2.1"
+
+# Orden de las columnas de features que espera el modelo
+FEATURE_COLS = [
+    'url_length', 'domain_length', 'path_length', 'num_digits',
+    'num_hyphens', 'num_dots', 'num_subdomains', 'entropy',
+    'has_https', 'has_port', 'has_at_symbol', 'contains_ip',
+    'has_punycode', 'shortener_detected', 'paste_service_detected',
+    'has_suspicious_words', 'tld_risk', 'excessive_subdomains',
+    'digit_ratio', 'num_params', 'special_chars',
+    'in_tranco', 'tranco_rank', 'brand_impersonation'
 ]
 
+# Features binarias (0/1): HistGradientBoosting las trata como categóricas
+BINARY_FEATURES = frozenset([
+    'has_https', 'has_port', 'has_at_symbol', 'contains_ip', 'has_punycode',
+    'shortener_detected', 'paste_service_detected', 'tld_risk',
+    'excessive_subdomains', 'in_tranco', 'brand_impersonation'
+])
+
+# Features de conteo (enteros no negativos)
+COUNT_FEATURES = frozenset([
+    'url_length', 'domain_length', 'path_length', 'num_digits', 'num_hyphens',
+    'num_dots', 'num_subdomains', 'has_suspicious_words', 'num_params', 'special_chars'
+])
+
+# dtypes compactos de la matriz de entrenamiento (int8 para 0/1, int32 para
+# conteos, float32 para el resto) en lugar de float64 en todas las columnas
+FEATURE_DTYPES = {
+    col: 'int8' if col in BINARY_FEATURES else 'int32' if col in COUNT_FEATURES else 'float32'
+    for col in FEATURE_COLS
+}
+
+# Valores por defecto cuando falla la extracción de una URL
+_DEFAULT_FEATURES = dict.fromkeys(FEATURE_COLS, 0)
+
+# Marcas conocidas -> dominio oficial
+BRAND_OFFICIAL_DOMAINS = {
+    'paypal': 'paypal.com', 'amazon': 'amazon.com', 'apple': 'apple.com',
+    'microsoft': 'microsoft.com', 'google': 'google.com', 'facebook': 'facebook.com',
+    'netflix': 'netflix.com', 'instagram': 'instagram.com', 'whatsapp': 'whatsapp.com',
+    'twitter': 'twitter.com', 'linkedin': 'linkedin.com', 'ebay': 'ebay.com',
+    'chase': 'chase.com', 'wellsfargo': 'wellsfargo.com', 'bankofamerica': 'bankofamerica.com'
+}
+
+# Patrones precompilados (una sola búsqueda en C en lugar de un `in` por elemento)
+_IP_RE = re.compile(r'^(?:\d{1,3}\.){3}\d{1,3}$')
+_URL_RE = re.compile(r'^([A-Za-z][A-Za-z0-9+.-]*)://([^/?#]*)([^?#]*)(?:\?([^#]*))?')
+# URLs que urlparse trata de forma especial (espacios y caracteres de
+# control, corchetes IPv6, no ASCII): se procesan con extract_features()
+_URLPARSE_ONLY_RE = re.compile(r'[\x00-\x20\[\]]|[^\x00-\x7f]')
+_URL_BYTES_RE = re.compile(rb'https?://[^\s<>"{}|\\^`\[\]]+')
+# Menciones de marca: el lookahead devuelve también coincidencias solapadas
+_BRAND_RE = re.compile(
+    '(?=(' + '|'.join(re.escape(brand) for brand in BRAND_OFFICIAL_DOMAINS) + '))'
+)
+
+# Tablas de traducción para contar caracteres con str.translate (en C)
+SPECIAL_CHARS = '!#$%&*+=?^_`{|}~'
+_DIGIT_TRANS = str.maketrans('', '', '0123456789')
+_SPECIAL_TRANS = str.maketrans('', '', SPECIAL_CHARS)
+
+
+def _build_automaton(words: Dict[str, str]):
+    """Construye un autómata Aho-Corasick palabra -> valor (None sin pyahocorasick)."""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for word, value in words.items():
+        automaton.add_word(word, value)
+    automaton.make_automaton()
+    return automaton
+
+
+_SUSPICIOUS_AC = _build_automaton({w: w for w in SUSPICIOUS_WORDS})
+
 # URLs legítimas conocidas - variadas, no solo de Tranco
 LEGITIMATE_URLS_VARIED = [
     # Grandes sitios (en Tranco)
@@ -134,18 +240,54 @@ LEGITIMATE_URLS_VARIED = [
 # FUNCIONES DE EXTRACCIÓN DE FEATURES
 # ============================================================================
 
-def calculate_entropy(text: str) -> float:
-    """Calcula la entropía de Shannon."""
-    if not text:
-        return 0.0
-    counter = Counter(text)
-    length = len(text)
-    entropy = 0.0
-    for count in counter.values():
-        if count > 0:
-            freq = count / length
-            entropy -= freq * math.log2(freq)
-    return entropy
+@lru_cache(maxsize=200_000)
+def _domain_features(domain: str) -> dict:
+    """
+    Features que solo dependen del host.
+
+    Muchas URLs de phishing comparten dominio (cientos de rutas en un
+    mismo sitio comprometido), por lo que se calculan una vez por dominio.
+    """
+    domain_without_port = domain.split(':')[0]
+    num_subdomains = max(0, domain.count('.') - 1) if domain else 0
+
+    # URL shortener / servicio de paste: se compara el dominio registrado
+    # (últimas dos etiquetas), así bit.ly-phish.com no cuenta como bit.ly
+    domain_suffix = '.'.join(domain_without_port.split('.')[-2:])
+
+    tld = domain.split('.')[-1] if domain else ''
+
+    return {
+        'domain_length': len(domain),
+        'num_subdomains': num_subdomains,
+        'has_port': 1 if ':' in domain.split('.')[-1] else 0,
+        'contains_ip': 1 if _IP_RE.match(domain_without_port) else 0,
+        'has_punycode': 1 if 'xn--' in domain else 0,
+        'shortener_detected': 1 if domain_suffix in SHORTENERS else 0,
+        'paste_service_detected': 1 if domain_suffix in PASTE_SERVICES else 0,
+        'tld_risk': 1 if tld in RISKY_TLDS else 0,
+        'excessive_subdomains': 1 if num_subdomains > 3 else 0,
+    }
+
+
+def _domain_features_batch(domains: pd.Series) -> dict:
+    """Versión vectorizada de _domain_features() (se aplica a dominios únicos)."""
+    host = domains.str.split(':', n=1).str[0]
+    num_subdomains = (domains.str.count(r'\.') - 1).clip(lower=0)
+    domain_suffix = host.str.split('.').str[-2:].str.join('.')
+    tld = domains.str.rsplit('.', n=1).str[-1]
+
+    return {
+        'domain_length': domains.str.len(),
+        'num_subdomains': num_subdomains,
+        'has_port': domains.str.contains(r':[^.]*$'),
+        'contains_ip': host.str.match(_IP_RE.pattern),
+        'has_punycode': domains.str.contains('xn--', regex=False),
+        'shortener_detected': domain_suffix.isin(SHORTENERS),
+        'paste_service_detected': domain_suffix.isin(PASTE_SERVICES),
+        'tld_risk': tld.isin(RISKY_TLDS),
+        'excessive_subdomains': num_subdomains > 3,
+    }
 
 
 def extract_features(url: str, in_tranco: int = 0, tranco_rank: float = 0.0) -> dict:
@@ -163,48 +305,40 @@ def extract_features(url: str, in_tranco: int = 0, tranco_rank: float = 0.0) ->
         path = parsed.path
         query = parsed.query
 
+        # Features del dominio (memoizadas por host)
+        dom = _domain_features(domain)
+
         # Features léxicas
         features['url_length'] = len(url)
-        features['domain_length'] = len(domain)
+        features['domain_length'] = dom['domain_length']
         features['path_length'] = len(path)
-        features['num_digits'] = sum(c.isdigit() for c in url)
+        if url.isascii():
+            features['num_digits'] = len(url) - len(url.translate(_DIGIT_TRANS))
+        else:
+            features['num_digits'] = sum(c.isdigit() for c in url)
         features['num_hyphens'] = url.count('-')
         features['num_dots'] = url.count('.')
-        features['num_subdomains'] = max(0, domain.count('.') - 1) if domain else 0
+        features['num_subdomains'] = dom['num_subdomains']
 
         # Entropía
         features['entropy'] = calculate_entropy(url)
 
         # Features binarias
         features['has_https'] = 1 if parsed.scheme == 'https' else 0
-        features['has_port'] = 1 if ':' in domain.split('.')[-1] else 0
+        features['has_port'] = dom['has_port']
         features['has_at_symbol'] = 1 if '@' in url else 0
-
-        # IP como host
-        ip_pattern = r'^(\d{1,3}\.){3}\d{1,3}$'
-        domain_without_port = domain.split(':')[0]
-        features['contains_ip'] = 1 if re.match(ip_pattern, domain_without_port) else 0
-
-        # Punycode
-        features['has_punycode'] = 1 if 'xn--' in domain else 0
-
-        # URL shortener
-        features['shortener_detected'] = 1 if any(s in domain for s in SHORTENERS) else 0
-
-        # Servicio de paste
-        features['paste_service_detected'] = 1 if any(p in domain for p in PASTE_SERVICES) else 0
+        features['contains_ip'] = dom['contains_ip']
+        features['has_punycode'] = dom['has_punycode']
+        features['shortener_detected'] = dom['shortener_detected']
+        features['paste_service_detected'] = dom['paste_service_detected']
 
         # Palabras sospechosas
         url_lower = url.lower()
-        suspicious_count = sum(1 for word in SUSPICIOUS_WORDS if word in url_lower)
-        features['has_suspicious_words'] = min(suspicious_count, 5)
+        features['has_suspicious_words'] = min(count_suspicious_words(url_lower), 5)
 
-        # TLD de riesgo
-        tld = domain.split('.')[-1] if domain else ''
-        features['tld_risk'] = 1 if tld in RISKY_TLDS else 0
-
-        # Subdominios excesivos
-        features['excessive_subdomains'] = 1 if features['num_subdomains'] > 3 else 0
+        # TLD de riesgo y subdominios excesivos
+        features['tld_risk'] = dom['tld_risk']
+        features['excessive_subdomains'] = dom['excessive_subdomains']
 
         # Ratio de dígitos
         features['digit_ratio'] = features['num_digits'] / len(url) if len(url) > 0 else 0
@@ -213,8 +347,7 @@ def extract_features(url: str, in_tranco: int = 0, tranco_rank: float = 0.0) ->
         features['num_params'] = len(parse_qs(query)) if query else 0
 
         # Caracteres especiales
-        special_chars = sum(1 for c in url if c in '!#$%&*+=?^_`{|}~')
-        features['special_chars'] = special_chars
+        features['special_chars'] = len(url) - len(url.translate(_SPECIAL_TRANS))
 
         # Features de Tranco (pasadas como parámetros)
         features['in_tranco'] = in_tranco
@@ -225,36 +358,150 @@ def extract_features(url: str, in_tranco: int = 0, tranco_rank: float = 0.0) ->
 
     except Exception as e:
         logger.warning(f"Error extrayendo features de {url}: {e}")
-        # Valores por defecto
-        for key in ['url_length', 'domain_length', 'path_length', 'num_digits',
-                    'num_hyphens', 'num_dots', 'num_subdomains', 'entropy',
-                    'has_https', 'has_port', 'has_at_symbol', 'contains_ip',
-                    'has_punycode', 'shortener_detected', 'paste_service_detected',
-                    'has_suspicious_words', 'tld_risk', 'excessive_subdomains',
-                    'digit_ratio', 'num_params', 'special_chars',
-                    'in_tranco', 'tranco_rank', 'brand_impersonation']:
-            features[key] = 0
+        features = _DEFAULT_FEATURES.copy()
 
     return features
 
 
+def extract_features_batch(
+    urls: pd.Series,
+    in_tranco=0,
+    tranco_rank=0.0
+) -> pd.DataFrame:
+    """
+    Extrae features de una Serie de URLs con operaciones vectorizadas.
+
+    Equivalente a aplicar extract_features() fila por fila, pero las
+    features léxicas se calculan columna a columna con los accesores
+    .str de pandas. in_tranco y tranco_rank aceptan un escalar o un
+    array del mismo largo que urls.
+    """
+    urls = urls.astype(str).reset_index(drop=True)
+    s = urls.str
+    url_lower = s.lower()
+
+    # scheme://netloc/path?query (misma división que urlparse)
+    parts = s.extract(_URL_RE).fillna('')
+    fallback = (parts[0] == '') | s.contains(_URLPARSE_ONLY_RE)
+    parts.loc[fallback] = ''
+    scheme = parts[0].str.lower()
+    domain = parts[1].str.lower()
+    # urlparse separa los ;params del último segmento solo en esos esquemas
+    path = parts[2].where(
+        ~scheme.isin(uses_params), parts[2].str.replace(r';[^/]*$', '', regex=True)
+    )
+    query = parts[3]
+
+    features = {}
+
+    # Features del dominio: se calculan sobre los dominios únicos
+    codes, unique_domains = pd.factorize(domain)
+    for col, values in _domain_features_batch(pd.Series(unique_domains, dtype=object)).items():
+        features[col] = np.asarray(values)[codes]
+
+    # Features léxicas
+    features['url_length'] = s.len()
+    features['path_length'] = path.str.len()
+    features['num_digits'] = s.count(r'[0-9]')
+    features['num_hyphens'] = s.count('-')
+    features['num_dots'] = s.count(r'\.')
+
+    # Entropía
+    features['entropy'] = entropy_batch(urls.tolist())
+
+    # Features binarias
+    features['has_https'] = scheme == 'https'
+    features['has_at_symbol'] = s.contains('@', regex=False)
+
+    # Palabras sospechosas (número de palabras distintas presentes, máx. 5)
+    suspicious_count = sum(
+        url_lower.str.contains(word, regex=False)
+        for word in SUSPICIOUS_WORDS
+    )
+    features['has_suspicious_words'] = suspicious_count.clip(upper=5)
+
+    features['digit_ratio'] = (features['num_digits'] / features['url_length']).fillna(0)
+
+    # parse_qs descarta parámetros vacíos: se mantiene su semántica por fila
+    features['num_params'] = query.map(lambda q: len(parse_qs(q)) if q else 0)
+    features['special_chars'] = s.count('[' + re.escape(SPECIAL_CHARS) + ']')
+
+    # Features de Tranco (pasadas como parámetros)
+    features['in_tranco'] = in_tranco
+    features['tranco_rank'] = tranco_rank
+
+    # Suplantación de marca: solo se revisan las filas que mencionan una marca
+    brand_impersonation = np.zeros(len(urls), dtype=np.int8)
+    mentions = url_lower.str.extractall(_BRAND_RE)[0]
+    if len(mentions):
+        rows = mentions.index.get_level_values(0).to_numpy()
+        domain_clean = domain.str.replace('www.', '', regex=False).to_numpy()[rows]
+        official = mentions.map(BRAND_OFFICIAL_DOMAINS).to_numpy()
+        spoofed = np.fromiter(
+            (o not in d for o, d in zip(official, domain_clean)), dtype=bool, count=len(rows)
+        )
+        brand_impersonation[rows[spoofed]] = 1
+    features['brand_impersonation'] = brand_impersonation
+
+    # Matriz float32 preasignada (una columna por feature) y un solo DataFrame
+    X = np.empty((len(urls), len(FEATURE_COLS)), dtype=np.float32)
+    for j, col in enumerate(FEATURE_COLS):
+        X[:, j] = features[col]
+
+    # Las filas que el regex no cubre se recalculan con extract_features()
+    if fallback.any():
+        in_tranco = np.broadcast_to(in_tranco, len(urls))
+        tranco_rank = np.broadcast_to(tranco_rank, len(urls))
+        for i in np.flatnonzero(fallback):
+            row = extract_features(urls[i], in_tranco[i], tranco_rank[i])
+            X[i] = [row[col] for col in FEATURE_COLS]
+
+    return pd.DataFrame(X, columns=FEATURE_COLS)
+
+
+def extract_features_parallel(
+    urls: List[str],
+    in_tranco=0,
+    tranco_rank=0.0,
+    chunk_size: int = 4096
+) -> pd.DataFrame:
+    """
+    Reparte extract_features_batch() en bloques de `chunk_size` URLs
+    entre todos los núcleos (procesos loky, sin GIL compartido).
+    """
+    if len(urls) <= chunk_size:
+        return extract_features_batch(pd.Series(urls), in_tranco, tranco_rank)
+
+    def chunk(values, start):
+        # Los parámetros de Tranco pueden ser escalares o arrays por URL
+        return values[start:start + chunk_size] if np.ndim(values) else values
+
+    results = Parallel(n_jobs=os.cpu_count(), backend='loky')(
+        delayed(extract_features_batch)(
+            pd.Series(urls[start:start + chunk_size]),
+            chunk(in_tranco, start),
+            chunk(tranco_rank, start)
+        )
+        for start in range(0, len(urls), chunk_size)
+    )
+    return pd.concat(results, ignore_index=True)
+
+
+def count_suspicious_words(url_lower: str) -> int:
+    """Cuenta cuántas palabras de SUSPICIOUS_WORDS distintas aparecen en la URL."""
+    if _SUSPICIOUS_AC is not None:
+        # Una sola pasada lineal sobre la URL
+        return len({word for _, word in _SUSPICIOUS_AC.iter(url_lower)})
+    return sum(1 for word in SUSPICIOUS_WORDS if word in url_lower)
+
+
 def detect_brand_impersonation(url: str, domain: str) -> int:
     """Detecta si la URL intenta suplantar una marca conocida."""
-    brands = {
-        'paypal': 'paypal.com', 'amazon': 'amazon.com', 'apple': 'apple.com',
-        'microsoft': 'microsoft.com', 'google': 'google.com', 'facebook': 'facebook.com',
-        'netflix': 'netflix.com', 'instagram': 'instagram.com', 'whatsapp': 'whatsapp.com',
-        'twitter': 'twitter.com', 'linkedin': 'linkedin.com', 'ebay': 'ebay.com',
-        'chase': 'chase.com', 'wellsfargo': 'wellsfargo.com', 'bankofamerica': 'bankofamerica.com'
-    }
-
-    url_lower = url.lower()
     domain_clean = domain.replace('www.', '')
 
-    for brand, official in brands.items():
-        if brand in url_lower:
-            if official not in domain_clean and domain_clean != official:
-                return 1
+    for match in _BRAND_RE.finditer(url.lower()):
+        if BRAND_OFFICIAL_DOMAINS[match.group(1)] not in domain_clean:
+            return 1
     return 0
 
 
@@ -262,6 +509,58 @@ def detect_brand_impersonation(url: str, domain: str) -> int:
 # FUNCIONES DE RECOPILACIÓN DE DATOS
 # ============================================================================
 
+def read_http_lines(path: Path, urls: set, limit: Optional[int] = None):
+    """
+    Agrega a `urls` las líneas de `path` que empiezan por http.
+
+    Recorre el archivo mapeado en memoria como bytes y solo decodifica
+    las líneas aceptadas. Se detiene cuando `urls` supera `limit`.
+    """
+    if path.stat().st_size == 0:
+        return
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for line in iter(mm.readline, b''):
+            line = line.strip()
+            if line.startswith(b'http'):
+                urls.add(line.decode('utf-8', 'ignore'))
+            if limit is not None and len(urls) > limit:
+                break
+
+
+@lru_cache(maxsize=1)
+def load_phiusiil() -> pd.DataFrame:
+    """
+    Lee las primeras 20K filas de PhiUSIIL una sola vez.
+
+    Solo se parsean las columnas URL y label (el CSV tiene 50+ columnas);
+    el resultado se comparte entre las cargas de phishing y legítimas.
+    """
+    phiusiil = DATOS_ENTRENADOS_DIR / "PhiUSIIL_Phishing_URL_Dataset.csv"
+    df = pd.read_csv(phiusiil, usecols=['URL', 'label'], nrows=20000, dtype={'URL': str})
+    return df.dropna(subset=['URL'])
+
+
+def canonical_url(url: str) -> str:
+    """Clave para deduplicar: https://x.com/ y https://X.com se consideran la misma URL."""
+    return url.lower().rstrip('/')
+
+
+def dedup_urls(urls: List[str], exclude: Optional[set] = None) -> List[str]:
+    """
+    Elimina URLs duplicadas (según canonical_url) conservando el orden.
+
+    Las URLs cuya clave canónica esté en `exclude` se descartan.
+    """
+    exclude = exclude or set()
+    unique = {}
+    for url in urls:
+        key = canonical_url(url)
+        if key not in unique and key not in exclude:
+            unique[key] = url
+    return list(unique.values())
+
+
 def load_phishing_from_sources() -> List[str]:
     """Carga URLs de phishing de todas las fuentes disponibles."""
     phishing_urls = set()
@@ -269,24 +568,14 @@ def load_phishing_from_sources() -> List[str]:
     # 1. Buenos_Datos/datos (contiene phishing a pesar del nombre)
     datos_file = BUENOS_DATOS_DIR / "datos"
     if datos_file.exists():
-        with open(datos_file, 'r', encoding='utf-8', errors='ignore') as f:
-            for line in f:
-                url = line.strip()
-                if url and url.startswith('http'):
-                    phishing_urls.add(url)
+        read_http_lines(datos_file, phishing_urls)
         logger.info(f"Cargadas {len(phishing_urls)} URLs de Buenos_Datos/datos")
 
     # 2. Phishing.Database-master
     phishing_db = BUENOS_DATOS_DIR / "Phishing.Database-master" / "phishing-links-ACTIVE.txt"
     if phishing_db.exists():
         count_before = len(phishing_urls)
-        with open(phishing_db, 'r', encoding='utf-8', errors='ignore') as f:
-            for line in f:
-                url = line.strip()
-                if url and url.startswith('http'):
-                    phishing_urls.add(url)
-                if len(phishing_urls) > 50000:  # Limitar a 50K
-                    break
+        read_http_lines(phishing_db, phishing_urls, limit=50000)  # Limitar a 50K
         logger.info(f"Cargadas {len(phishing_urls) - count_before} URLs adicionales de Phishing.Database")
 
     # 3. PhiUSIIL Dataset
@@ -294,12 +583,9 @@ def load_phishing_from_sources() -> List[str]:
     if phiusiil.exists():
         count_before = len(phishing_urls)
         try:
-            df = pd.read_csv(phiusiil, nrows=20000)  # Limitar a 20K filas
-            if 'URL' in df.columns and 'label' in df.columns:
-                phishing_df = df[df['label'] == 1]
-                for url in phishing_df['URL'].dropna():
-                    if str(url).startswith('http'):
-                        phishing_urls.add(str(url))
+            df = load_phiusiil()
+            phishing = df.loc[df['label'] == 1, 'URL']
+            phishing_urls.update(phishing[phishing.str.startswith('http')])
             logger.info(f"Cargadas {len(phishing_urls) - count_before} URLs de PhiUSIIL")
         except Exception as e:
             logger.warning(f"Error cargando PhiUSIIL: {e}")
@@ -309,13 +595,12 @@ def load_phishing_from_sources() -> List[str]:
     if datos_json.exists():
         count_before = len(phishing_urls)
         try:
-            with open(datos_json, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-                # Buscar URLs en el contenido
-                url_pattern = r'https?://[^\s<>"{}|\\^`\[\]]+'
-                found_urls = re.findall(url_pattern, content)
-                for url in found_urls[:10000]:  # Limitar
-                    phishing_urls.add(url)
+            if datos_json.stat().st_size:
+                with open(datos_json, 'rb') as f, \
+                        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    # Buscar URLs en el contenido (se detiene en la coincidencia 10K)
+                    for match in itertools.islice(_URL_BYTES_RE.finditer(mm), 10000):
+                        phishing_urls.add(match.group().decode('utf-8', 'ignore'))
             logger.info(f"Cargadas {len(phishing_urls) - count_before} URLs de datos_jison")
         except Exception as e:
             logger.warning(f"Error cargando datos_jison: {e}")
@@ -356,12 +641,9 @@ def load_legitimate_urls() -> List[str]:
     phiusiil = DATOS_ENTRENADOS_DIR / "PhiUSIIL_Phishing_URL_Dataset.csv"
     if phiusiil.exists():
         try:
-            df = pd.read_csv(phiusiil, nrows=20000)
-            if 'URL' in df.columns and 'label' in df.columns:
-                legit_df = df[df['label'] == 0]
-                for url in legit_df['URL'].dropna()[:5000]:
-                    if str(url).startswith('http'):
-                        legitimate_urls.add(str(url))
+            df = load_phiusiil()
+            legit = df.loc[df['label'] == 0, 'URL'][:5000]
+            legitimate_urls.update(legit[legit.str.startswith('http')])
             logger.info(f"Agregadas URLs legítimas de PhiUSIIL")
         except Exception as e:
             logger.warning(f"Error cargando legítimas de PhiUSIIL: {e}")
@@ -369,42 +651,113 @@ def load_legitimate_urls() -> List[str]:
     return list(legitimate_urls)
 
 
-def verify_with_virustotal(urls: List[str], max_urls: int = 500) -> Dict[str, dict]:
+class SQLiteCache:
+    """Cache clave -> valor JSON persistente en SQLite, con expiración (TTL)."""
+
+    def __init__(self, path: Path, ttl: float):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+        )
+
+    def get(self, key: str, default=None):
+        row = self._conn.execute(
+            "SELECT value, created FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return default
+        return json.loads(row[0])
+
+    def set(self, key: str, value):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time())
+            )
+
+
+class AsyncRateLimiter:
+    """Token bucket asíncrono: como máximo `rate` peticiones por `period` segundos."""
+
+    def __init__(self, rate: int, period: float = 60.0):
+        self.rate = rate
+        self.period = period
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.rate,
+                    self._tokens + (now - self._updated) * self.rate / self.period
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return self
+                await asyncio.sleep((1 - self._tokens) * self.period / self.rate)
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+async def verify_with_virustotal_async(urls: List[str], max_urls: int = 500) -> Dict[str, dict]:
     """
-    Verifica URLs con VirusTotal para obtener contexto real.
+    Verifica URLs con VirusTotal de forma concurrente.
+
+    Las consultas comparten una sesión aiohttp y se limitan con un token
+    bucket de VIRUSTOTAL_RPM peticiones/minuto, de modo que con una API
+    key premium se aprovecha todo el cupo en lugar de una petición cada 15s.
 
     Returns:
         Dict con URL -> {is_malicious, malicious_count, harmless_count, confidence}
     """
-    if not VIRUSTOTAL_API_KEY:
-        logger.warning("VIRUSTOTAL_API_KEY no configurada, saltando verificación")
-        return {}
-
     results = {}
     headers = {"x-apikey": VIRUSTOTAL_API_KEY}
 
-    # Seleccionar URLs aleatorias para verificar
+    # Seleccionar URLs aleatorias (sin repetir) para verificar
+    urls = dedup_urls(urls)
     urls_to_check = random.sample(urls, min(len(urls), max_urls))
 
-    logger.info(f"Verificando {len(urls_to_check)} URLs con VirusTotal...")
-
-    for i, url in enumerate(urls_to_check):
-        if i % 50 == 0:
-            logger.info(f"  Progreso: {i}/{len(urls_to_check)}")
-
-        try:
-            # Codificar URL para VT
-            url_id = hashlib.sha256(url.encode()).hexdigest()
-
-            # Consultar VT
-            response = requests.get(
-                f"https://www.virustotal.com/api/v3/urls/{url_id}",
-                headers=headers,
-                timeout=10
-            )
+    # Las URLs consultadas en las últimas 24h se leen del cache en disco
+    cache = SQLiteCache(CACHE_DIR / "virustotal.sqlite", VIRUSTOTAL_CACHE_TTL)
+    for url in urls_to_check:
+        cached = cache.get(url)
+        if cached is not None:
+            results[url] = cached
+    cached_count = len(results)
+    urls_to_check = [url for url in urls_to_check if url not in results]
+
+    logger.info(f"Verificando {len(urls_to_check)} URLs con VirusTotal ({cached_count} en cache)...")
+
+    limiter = AsyncRateLimiter(VIRUSTOTAL_RPM, period=60)
+    semaphore = asyncio.Semaphore(VIRUSTOTAL_MAX_CONCURRENCY)
+    timeout = aiohttp.ClientTimeout(total=10)
+    done = 0
+
+    async def worker(session: aiohttp.ClientSession, url: str):
+        nonlocal done
+        async with semaphore:
+            try:
+                # Identificador de URL de VT: base64 urlsafe sin relleno
+                url_id = base64.urlsafe_b64encode(url.encode()).rstrip(b'=').decode()
+
+                async with limiter:
+                    async with session.get(
+                        f"https://www.virustotal.com/api/v3/urls/{url_id}",
+                        headers=headers,
+                        timeout=timeout
+                    ) as response:
+                        if response.status != 200:
+                            return
+                        data = await response.json()
 
-            if response.status_code == 200:
-                data = response.json()
                 stats = data.get('data', {}).get('attributes', {}).get('last_analysis_stats', {})
 
                 malicious = stats.get('malicious', 0) + stats.get('suspicious', 0)
@@ -417,18 +770,33 @@ def verify_with_virustotal(urls: List[str], max_urls: int = 500) -> Dict[str, di
                     'harmless_count': harmless,
                     'confidence': (max(malicious, harmless) / total) if total > 0 else 0
                 }
+                cache.set(url, results[url])
 
-            # Respetar rate limit de VT (4 requests/min para API gratuita)
-            time.sleep(15)
+            except Exception as e:
+                logger.debug(f"Error verificando {url}: {e}")
 
-        except Exception as e:
-            logger.debug(f"Error verificando {url}: {e}")
-            continue
+            finally:
+                done += 1
+                if done % 50 == 0:
+                    logger.info(f"  Progreso: {done}/{len(urls_to_check)}")
+
+    connector = aiohttp.TCPConnector(limit_per_host=VIRUSTOTAL_MAX_CONCURRENCY)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(worker(session, url) for url in urls_to_check))
 
     logger.info(f"Verificadas {len(results)} URLs con VirusTotal")
     return results
 
 
+def verify_with_virustotal(urls: List[str], max_urls: int = 500) -> Dict[str, dict]:
+    """Versión síncrona de verify_with_virustotal_async() para el script."""
+    if not VIRUSTOTAL_API_KEY:
+        logger.warning("VIRUSTOTAL_API_KEY no configurada, saltando verificación")
+        return {}
+
+    return asyncio.run(verify_with_virustotal_async(urls, max_urls))
+
+
 # ============================================================================
 # CONSTRUCCIÓN DEL DATASET
 # ============================================================================
@@ -449,84 +817,115 @@ def build_balanced_dataset(
     logger.info("="*60)
 
     # 1. Cargar URLs de phishing
-    phishing_urls = load_phishing_from_sources()
+    phishing_urls = dedup_urls(load_phishing_from_sources())
     logger.info(f"Total URLs phishing disponibles: {len(phishing_urls)}")
 
     # 2. Cargar URLs legítimas
+    # Las URLs que también aparecen como phishing se descartan de las legítimas
+    # para no meter la misma URL con las dos etiquetas
     legitimate_urls = load_legitimate_urls()
-    logger.info(f"Total URLs legítimas disponibles: {len(legitimate_urls)}")
+    legit_count = len(legitimate_urls)
+    legitimate_urls = dedup_urls(
+        legitimate_urls, exclude={canonical_url(u) for u in phishing_urls}
+    )
+    logger.info(f"Total URLs legítimas disponibles: {len(legitimate_urls)} "
+                f"({legit_count - len(legitimate_urls)} duplicadas descartadas)")
 
     # 3. Verificar muestra con VirusTotal
     all_urls = phishing_urls[:1000] + legitimate_urls[:500]
     vt_results = verify_with_virustotal(all_urls, verify_vt_count)
 
     # 4. Construir dataset
-    data = []
-
-    # Agregar phishing (label=1)
+    # Para phishing: in_tranco=0 (típicamente no están en Tranco)
     phishing_sample = random.sample(phishing_urls, min(len(phishing_urls), max_phishing))
-    for url in phishing_sample:
-        # Para phishing: in_tranco=0 (típicamente no están en Tranco)
-        # Pero algunos pueden tener subdominios de sitios legítimos
-        features = extract_features(url, in_tranco=0, tranco_rank=0.0)
-        features['url'] = url
-        features['label'] = 1
-
-        # Si tenemos info de VT, usarla
-        if url in vt_results:
-            vt = vt_results[url]
-            features['vt_verified'] = 1
-            features['vt_malicious'] = vt['malicious_count']
-        else:
-            features['vt_verified'] = 0
-            features['vt_malicious'] = 0
-
-        data.append(features)
-
-    logger.info(f"Agregadas {len(phishing_sample)} URLs de phishing")
-
-    # Agregar legítimas (label=0)
     legitimate_sample = random.sample(legitimate_urls, min(len(legitimate_urls), max_legitimate))
+    n_phishing = len(phishing_sample)
+    n_legit = len(legitimate_sample)
 
-    # IMPORTANTE: Variar in_tranco para evitar overfitting
-    # Algunos legítimos con in_tranco=1 (sitios grandes)
-    # Algunos legítimos con in_tranco=0 (sitios pequeños/medianos)
-    for i, url in enumerate(legitimate_sample):
-        # 70% con in_tranco=1, 30% con in_tranco=0 (para simular sitios pequeños legítimos)
-        if i < len(legitimate_sample) * 0.7:
-            in_tranco = 1
-            tranco_rank = random.uniform(0.5, 1.0)
-        else:
-            in_tranco = 0  # Sitios legítimos pequeños NO están en Tranco
-            tranco_rank = 0.0
-
-        features = extract_features(url, in_tranco=in_tranco, tranco_rank=tranco_rank)
-        features['url'] = url
-        features['label'] = 0
-
-        # Si tenemos info de VT, usarla
-        if url in vt_results:
-            vt = vt_results[url]
-            features['vt_verified'] = 1
-            features['vt_malicious'] = vt['malicious_count']
-        else:
-            features['vt_verified'] = 0
-            features['vt_malicious'] = 0
-
-        data.append(features)
+    # Features derivadas de la URL: una sola pasada para phishing y legítimas
+    df = extract_features_parallel(phishing_sample + legitimate_sample)
+    df['url'] = phishing_sample + legitimate_sample
+    df['label'] = np.repeat([1, 0], [n_phishing, n_legit])
 
-    logger.info(f"Agregadas {len(legitimate_sample)} URLs legítimas")
+    logger.info(f"Agregadas {n_phishing} URLs de phishing")
+    logger.info(f"Agregadas {n_legit} URLs legítimas")
 
-    # 5. Crear DataFrame
-    df = pd.DataFrame(data)
+    # IMPORTANTE: Variar in_tranco para evitar overfitting
+    # 70% de las legítimas con in_tranco=1 (sitios grandes), 30% con in_tranco=0
+    # (sitios pequeños legítimos). Las columnas de Tranco no dependen del resto
+    # de features, así que se asignan después de la extracción.
+    n_tranco = min(n_legit, math.ceil(n_legit * 0.7))
+    in_tranco = np.zeros(len(df), dtype=np.float32)
+    in_tranco[n_phishing:n_phishing + n_tranco] = 1
+    tranco_rank = np.zeros(len(df), dtype=np.float32)
+    tranco_rank[n_phishing:n_phishing + n_tranco] = np.random.uniform(0.5, 1.0, n_tranco)
+    df['in_tranco'] = in_tranco
+    df['tranco_rank'] = tranco_rank
+
+    # Si tenemos info de VT, usarla
+    df['vt_verified'] = df['url'].isin(vt_results.keys()).astype('int8')
+    vt_malicious = {url: result['malicious_count'] for url, result in vt_results.items()}
+    df['vt_malicious'] = df['url'].map(vt_malicious).fillna(0).astype(int)
 
     # Shuffle
     df = df.sample(frac=1, random_state=42).reset_index(drop=True)
 
+    label_counts = df['label'].value_counts()
     logger.info(f"Dataset final: {len(df)} URLs")
-    logger.info(f"  - Phishing (1): {len(df[df['label']==1])}")
-    logger.info(f"  - Legítimas (0): {len(df[df['label']==0])}")
-    logger.info(f"  - Verificadas VT: {len(df[df['vt_verified']==1])}")
+    logger.info(f"  - Phishing (1): {label_counts.get(1, 0)}")
+    logger.info(f"  - Legítimas (0): {label_counts.get(0, 0)}")
+    logger.info(f"  - Verificadas VT: {int(df['vt_verified'].sum())}")
+
+    return df
+
+
+def _dataset_cache_path(**params) -> Path:
+    """
+    Ruta del dataset cacheado en Parquet.
+
+    La clave combina la fecha de modificación de las fuentes, la versión
+    del extractor y los parámetros, así el cache se invalida solo.
+    """
+    sources = [
+        BUENOS_DATOS_DIR / "datos",
+        BUENOS_DATOS_DIR / "Phishing.Database-master" / "phishing-links-ACTIVE.txt",
+        DATOS_ENTRENADOS_DIR / "PhiUSIIL_Phishing_URL_Dataset.csv",
+        DATOS_MALOS_DIR / "datos_jison",
+    ]
+    key_parts = [FEATURE_EXTRACTOR_VERSION, json.dumps(params, sort_keys=True)]
+    key_parts += [f"{p.name}:{p.stat().st_mtime_ns if p.exists() else 0}" for p in sources]
+    cache_key = hashlib.sha256("|".join(key_parts).encode()).hexdigest()[:16]
+    return MODELS_DIR / f"features_{cache_key}.parquet"
+
+
+def load_or_build_dataset(
+    max_phishing: int = 3000,
+    max_legitimate: int = 3000,
+    verify_vt_count: int = 500
+) -> pd.DataFrame:
+    """build_balanced_dataset() con cache en Parquet entre ejecuciones."""
+    cache_path = _dataset_cache_path(
+        max_phishing=max_phishing,
+        max_legitimate=max_legitimate,
+        verify_vt_count=verify_vt_count
+    )
+
+    if cache_path.exists():
+        try:
+            df = pd.read_parquet(cache_path)
+            logger.info(f"Dataset cargado desde cache: {cache_path}")
+            return df
+        except ImportError:
+            logger.warning("No se puede leer el cache Parquet: pyarrow/fastparquet no instalado")
+
+    df = build_balanced_dataset(max_phishing, max_legitimate, verify_vt_count)
+
+    try:
+        MODELS_DIR.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(cache_path, compression="zstd", index=False)
+        logger.info(f"Dataset cacheado en {cache_path}")
+    except ImportError:
+        logger.warning("Cache Parquet desactivado: pyarrow/fastparquet no instalado")
 
     return df
 
@@ -535,7 +934,7 @@ def build_balanced_dataset(
 # ENTRENAMIENTO DEL MODELO
 # ============================================================================
 
-def train_model(df: pd.DataFrame) -> Tuple[Pipeline, List[str]]:
+def train_model(df: pd.DataFrame) -> Tuple[ClassifierMixin, List[str]]:
     """
     Entrena el modelo con el dataset construido.
 
@@ -547,17 +946,9 @@ def train_model(df: pd.DataFrame) -> Tuple[Pipeline, List[str]]:
     logger.info("="*60)
 
     # Features a usar (excluir url, label, vt_verified, vt_malicious que son metadata)
-    feature_cols = [
-        'url_length', 'domain_length', 'path_length', 'num_digits',
-        'num_hyphens', 'num_dots', 'num_subdomains', 'entropy',
-        'has_https', 'has_port', 'has_at_symbol', 'contains_ip',
-        'has_punycode', 'shortener_detected', 'paste_service_detected',
-        'has_suspicious_words', 'tld_risk', 'excessive_subdomains',
-        'digit_ratio', 'num_params', 'special_chars',
-        'in_tranco', 'tranco_rank', 'brand_impersonation'
-    ]
+    feature_cols = list(FEATURE_COLS)
 
-    X = df[feature_cols]
+    X = df[feature_cols].astype(FEATURE_DTYPES)
     y = df['label']
 
     # Split
@@ -573,22 +964,28 @@ def train_model(df: pd.DataFrame) -> Tuple[Pipeline, List[str]]:
             ('scaler', StandardScaler()),
             ('classifier', LogisticRegression(C=0.5, max_iter=1000, random_state=42))
         ]),
-        'RandomForest': Pipeline([
-            ('scaler', StandardScaler()),
-            ('classifier', RandomForestClassifier(
-                n_estimators=100, max_depth=10, min_samples_split=5,
-                random_state=42, n_jobs=-1
-            ))
-        ]),
-        'GradientBoosting': Pipeline([
-            ('scaler', StandardScaler()),
-            ('classifier', GradientBoostingClassifier(
-                n_estimators=100, max_depth=5, learning_rate=0.1,
-                random_state=42
-            ))
-        ])
+        # Los árboles no dependen de la escala: sin StandardScaler
+        'RandomForest': RandomForestClassifier(
+            n_estimators=100, max_depth=10, min_samples_split=5,
+            random_state=42, n_jobs=ESTIMATOR_JOBS
+        ),
+        # Histogramas de 256 bins en lugar del split exacto por muestra
+        'HistGradientBoosting': HistGradientBoostingClassifier(
+            max_iter=200, max_depth=6, learning_rate=0.1,
+            early_stopping=True, random_state=42,
+            categorical_features=[col in BINARY_FEATURES for col in feature_cols]
+        )
     }
 
+    # Folds y matriz de validación cruzada preparados una sola vez: todos los
+    # modelos se comparan con las mismas particiones y ninguno vuelve a
+    # convertir el DataFrame a ndarray en cada fold
+    cv_splits = list(
+        StratifiedKFold(n_splits=CV_FOLDS, shuffle=True, random_state=42).split(X_train, y_train)
+    )
+    X_train_cv = X_train.to_numpy(dtype=np.float32)
+    y_train_cv = y_train.to_numpy()
+
     best_model = None
     best_score = 0
     best_name = ""
@@ -597,7 +994,10 @@ def train_model(df: pd.DataFrame) -> Tuple[Pipeline, List[str]]:
         logger.info(f"\nEntrenando {name}...")
 
         # Cross-validation
-        cv_scores = cross_val_score(model, X_train, y_train, cv=5, scoring='accuracy')
+        with parallel_config(backend='loky', inner_max_num_threads=ESTIMATOR_JOBS):
+            cv_scores = cross_val_score(
+                model, X_train_cv, y_train_cv, cv=cv_splits, scoring='accuracy', n_jobs=CV_JOBS
+            )
         logger.info(f"  CV Accuracy: {cv_scores.mean():.4f} (+/- {cv_scores.std()*2:.4f})")
 
         # Entrenar
@@ -626,10 +1026,9 @@ def train_model(df: pd.DataFrame) -> Tuple[Pipeline, List[str]]:
     logger.info(f"  [[TN={cm[0,0]}, FP={cm[0,1]}]")
     logger.info(f"   [FN={cm[1,0]}, TP={cm[1,1]}]]")
 
-    # Importancia de features (si es RandomForest o GradientBoosting)
-    if best_name in ['RandomForest', 'GradientBoosting']:
-        classifier = best_model.named_steps['classifier']
-        importances = classifier.feature_importances_
+    # Importancia de features (HistGradientBoosting no expone feature_importances_)
+    if best_name == 'RandomForest':
+        importances = best_model.feature_importances_
         indices = np.argsort(importances)[::-1]
 
         logger.info("\nTop 10 features por importancia:")
@@ -640,7 +1039,22 @@ def train_model(df: pd.DataFrame) -> Tuple[Pipeline, List[str]]:
     return best_model, feature_cols
 
 
-def save_model(pipeline: Pipeline, feature_names: List[str]):
+class HashingWriter:
+    """Envuelve un archivo binario y calcula el SHA256 de todo lo que se escribe."""
+
+    def __init__(self, f):
+        self._f = f
+        self._hash = hashlib.sha256()
+
+    def write(self, data) -> int:
+        self._hash.update(data)
+        return self._f.write(data)
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+def save_model(pipeline: ClassifierMixin, feature_names: List[str]):
     """Guarda el modelo entrenado."""
     MODELS_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -656,24 +1070,22 @@ def save_model(pipeline: Pipeline, feature_names: List[str]):
         }
     }
 
-    # Guardar como best_model.pkl
+    # Guardar como best_model.pkl (el hash se calcula mientras se escribe)
     model_path = MODELS_DIR / "best_model.pkl"
     with open(model_path, 'wb') as f:
-        pickle.dump(model_data, f)
-
-    # Calcular y mostrar hash
-    with open(model_path, 'rb') as f:
-        model_hash = hashlib.sha256(f.read()).hexdigest()
+        writer = HashingWriter(f)
+        # Protocolo 5 (PEP 574): los arrays NumPy se escriben sin copia intermedia
+        pickle.dump(model_data, writer, protocol=pickle.HIGHEST_PROTOCOL)
+    model_hash = writer.hexdigest()
 
     logger.info(f"\nModelo guardado en {model_path}")
     logger.info(f"Hash SHA256: {model_hash}")
     logger.info(f"\nACTUALIZAR en predictor.py:")
     logger.info(f'AUTHORIZED_MODEL_HASH = "{model_hash}"')
 
-    # También guardar como step1_baseline.pkl para compatibilidad
+    # También guardar como step1_baseline.pkl para compatibilidad (mismo hash)
     compat_path = MODELS_DIR / "step1_baseline.pkl"
-    with open(compat_path, 'wb') as f:
-        pickle.dump(model_data, f)
+    shutil.copyfile(model_path, compat_path)
     logger.info(f"Copia de compatibilidad guardada en {compat_path}")
 
 
@@ -694,7 +1106,7 @@ def main():
     logger.info("")
 
     # 1. Construir dataset balanceado
-    df = build_balanced_dataset(
+    df = load_or_build_dataset(
         max_phishing=3000,
         max_legitimate=3000,
         verify_vt_count=100  # Reducido para prueba inicial (aumentar a 500 después)
@@ -707,12 +1119,11 @@ def main():
     train_backup = SPLITS_DIR / f"train_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
     current_train = SPLITS_DIR / "train.csv"
     if current_train.exists():
-        import shutil
         shutil.copy(current_train, train_backup)
         logger.info(f"Backup creado: {train_backup}")
 
     # Guardar nuevo dataset
-    df.to_csv(current_train, index=False)
+    df.to_csv(current_train, index=False, float_format='%.4f')
     logger.info(f"Dataset guardado: {current_train}")
 
     # 3. Entrenar modelo
@@ -19,21 +19,26 @@ import os
 import sys
 import json
 import re
-import math
 import logging
 from pathlib import Path
 from datetime import datetime
 from collections import Counter
 from urllib.parse import urlparse, parse_qs
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Tuple, Any, Optional
 
 import pandas as pd
 import numpy as np
+from joblib import Parallel, delayed
 from sklearn.metrics import (
     accuracy_score, precision_score, recall_score, f1_score,
-    confusion_matrix, classification_report
+    confusion_matrix, classification_report, precision_recall_curve
 )
 
+try:
+    import ahocorasick  # pyahocorasick (opcional): búsqueda multi-patrón en C
+except ImportError:
+    ahocorasick = None
+
 # Configuracion de logging
 logging.basicConfig(
     level=logging.INFO,
@@ -47,6 +52,10 @@ DATASETS_DIR = PROJECT_ROOT / "datasets"
 SPLITS_DIR = DATASETS_DIR / "splits"
 REPORTS_DIR = PROJECT_ROOT / "reports"
 
+# Entropía y lectura del CSV compartidas con el script de entrenamiento
+sys.path.insert(0, str(PROJECT_ROOT / "scripts"))
+from train_step1 import calculate_entropy, entropy_batch, read_url_labels
+
 # ============================================================================
 # REGLAS HEURISTICAS (mismo código que en Dart para consistencia)
 # ============================================================================
@@ -102,12 +111,12 @@ URL_SHORTENERS = [
     'cutt.ly', 'shorte.st', 'bc.vc', 'j.mp',
 ]
 
-# TLDs de riesgo
-RISKY_TLDS = [
+# TLDs de riesgo (conjunto: se consulta una vez por URL)
+RISKY_TLDS = frozenset([
     'xyz', 'top', 'club', 'online', 'site',
     'website', 'space', 'tech', 'info', 'biz',
     'cc', 'tk', 'ml', 'ga', 'cf', 'gq', 'pw', 'ws',
-]
+])
 
 # Marcas objetivo
 TARGETED_BRANDS = [
@@ -124,6 +133,18 @@ OFFICIAL_DOMAINS = [
     'facebook.com', 'instagram.com', 'whatsapp.com',
 ]
 
+# str.endswith acepta una tupla y recorre los sufijos en C
+_OFFICIAL_SUFFIXES = tuple(OFFICIAL_DOMAINS)
+
+# Índice por TLD (primer nivel de un trie de etiquetas invertidas): si el TLD
+# es riesgoso y qué dominios oficiales terminan en él. Un dominio que termina
+# en 'paypal.com' tiene TLD 'com', así que basta comparar esos sufijos
+_TLD_INDEX = {
+    tld: (tld in RISKY_TLDS, tuple(d for d in OFFICIAL_DOMAINS if d.rsplit('.', 1)[-1] == tld))
+    for tld in RISKY_TLDS | {d.rsplit('.', 1)[-1] for d in OFFICIAL_DOMAINS}
+}
+_UNKNOWN_TLD = (False, ())
+
 # Typosquatting
 TYPOSQUATTING_PATTERNS = [
     {'pattern': 'paypa1', 'brand': 'PayPal'},
@@ -137,25 +158,306 @@ TYPOSQUATTING_PATTERNS = [
     {'pattern': 'rnicrosoft', 'brand': 'Microsoft'},
 ]
 
+# Patrón de IP precompilado (se evalúa una vez por URL)
+_IP_RE = re.compile(r'^(\d{1,3}\.){3}\d{1,3}$')
 
-def calculate_entropy(text: str) -> float:
-    """Calcula entropía de Shannon."""
-    if not text:
-        return 0.0
-    counter = Counter(text)
-    length = len(text)
-    entropy = 0.0
-    for count in counter.values():
-        if count > 0:
-            freq = count / length
-            entropy -= freq * math.log2(freq)
-    return entropy
+# scheme://netloc (misma división que urlparse)
+_URL_RE = re.compile(r'^([A-Za-z][A-Za-z0-9+.-]*)://([^/?#]*)')
+# URLs que urlparse trata de forma especial (IPv6, tabs/saltos de línea, no ASCII)
+_URLPARSE_ONLY_RE = re.compile(r'[\[\]\t\r\n]|[^\x00-\x7f]')
+
+# Señales en el orden en que las verifica analyze_url_heuristic()
+SIGNAL_ORDER = [
+    'NO_HTTPS', 'IP_AS_HOST', 'PUNYCODE_DETECTED', 'EXCESSIVE_SUBDOMAINS',
+    'AT_SYMBOL', 'LONG_URL', 'HIGH_DIGIT_RATIO', 'MANY_HYPHENS', 'HIGH_ENTROPY',
+    'URL_SHORTENER', 'RISKY_TLD', 'SUSPICIOUS_WORDS', 'TYPOSQUATTING',
+    'BRAND_IMPERSONATION',
+]
+
+# Con n caracteres la entropía no supera log2(n): un dominio de hasta
+# 16 caracteres nunca pasa el umbral de HIGH_ENTROPY (4.0) y no se calcula
+ENTROPY_MIN_LENGTH = 16
+
+# Cada señal ocupa un bit de una máscara entera. _MASK_SCORES[mask] es la suma
+# de los pesos fijos de los bits encendidos (SUSPICIOUS_WORDS se suma aparte,
+# porque depende de la cantidad de palabras)
+SIGNAL_BITS = {name: 1 << i for i, name in enumerate(SIGNAL_ORDER)}
+WEIGHT_ARR = np.array([0 if n == 'SUSPICIOUS_WORDS' else WEIGHTS[n] for n in SIGNAL_ORDER])
+_MASK_SCORES_ARR = (
+    ((np.arange(1 << len(SIGNAL_ORDER))[:, None] >> np.arange(len(SIGNAL_ORDER))) & 1) @ WEIGHT_ARR
+)
+_MASK_SCORES = _MASK_SCORES_ARR.tolist()
+
+
+def _build_automaton(words: Dict[str, str]):
+    """Construye un autómata Aho-Corasick palabra -> valor (None sin pyahocorasick)."""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for word, value in words.items():
+        automaton.add_word(word, value)
+    automaton.make_automaton()
+    return automaton
+
+
+# Todas las listas de palabras en un solo autómata: palabra -> (palabra, categorías).
+# 'suspicious' se busca en toda la URL; el resto solo cuenta dentro del dominio.
+_KEYWORD_LISTS = {
+    'suspicious': SUSPICIOUS_WORDS,
+    'shortener': URL_SHORTENERS,
+    'typosquatting': [p['pattern'] for p in TYPOSQUATTING_PATTERNS],
+    'brand': TARGETED_BRANDS,
+}
+_KEYWORD_CATEGORIES = {
+    word: tuple(c for c, group in _KEYWORD_LISTS.items() if word in group)
+    for words in _KEYWORD_LISTS.values() for word in words
+}
+_KEYWORDS_AC = _build_automaton({w: (w, c) for w, c in _KEYWORD_CATEGORIES.items()})
+
+# Sin pyahocorasick: una alternación compilada por categoría del dominio,
+# así cada lista se revisa con un solo search() en lugar de un `in` por patrón
+_DOMAIN_KEYWORD_RES = {
+    category: re.compile('|'.join(re.escape(w) for w in words))
+    for category, words in _KEYWORD_LISTS.items() if category != 'suspicious'
+}
+
+# Lo mismo en arreglos para scan_keywords_batch(): índice, largo y categorías
+# (un bit por categoría de _KEYWORD_LISTS) de cada palabra
+_KEYWORD_INDEX = {word: i for i, word in enumerate(_KEYWORD_CATEGORIES)}
+_KEYWORD_LENGTHS = np.array([len(word) for word in _KEYWORD_CATEGORIES])
+_KEYWORD_CATEGORY_BITS = np.array([
+    sum(1 << i for i, c in enumerate(_KEYWORD_LISTS) if c in categories)
+    for categories in _KEYWORD_CATEGORIES.values()
+])
+
+
+def _fast_parse(url_lower: str) -> Optional[Tuple[str, str]]:
+    """
+    Devuelve (scheme, netloc) igual que urlparse, con un solo regex.
+
+    Recibe la URL ya en minúsculas, así que el scheme no se vuelve a
+    convertir. urlparse solo se usa para los casos especiales (URLs sin
+    scheme://, IPv6, tabs/saltos de línea, caracteres no ASCII) y es lo
+    único que puede fallar: en ese caso devuelve None.
+    """
+    match = _URL_RE.match(url_lower)
+    if match is None or _URLPARSE_ONLY_RE.search(url_lower):
+        try:
+            parsed = urlparse(url_lower)
+        except ValueError as e:
+            # IPv6 mal formada o netloc inválido tras normalizar (NFKC)
+            logger.warning(f"Error analizando {url_lower}: {e}")
+            return None
+        return parsed.scheme, parsed.netloc
+    return match.group(1), match.group(2)
 
 
 def is_ip_address(host: str) -> bool:
     """Verifica si el host es una IP."""
-    pattern = r'^(\d{1,3}\.){3}\d{1,3}$'
-    return bool(re.match(pattern, host.split(':')[0]))
+    return _IP_RE.match(host.split(':', 1)[0]) is not None
+
+
+def scan_keywords(url_lower: str, domain: str) -> Tuple[int, set]:
+    """
+    Busca todas las listas de palabras con una sola pasada sobre la URL.
+
+    Returns:
+        Tuple[int, set]: (palabras sospechosas distintas, categorías
+        shortener/typosquatting/brand presentes en el dominio)
+    """
+    if _KEYWORDS_AC is None:
+        domain_hits = {
+            category for category, regex in _DOMAIN_KEYWORD_RES.items() if regex.search(domain)
+        }
+        return sum(1 for w in SUSPICIOUS_WORDS if w in url_lower), domain_hits
+
+    # El dominio va justo después de '//'; si urlparse lo limpió (tabs,
+    # saltos de línea) no coincide con la URL y se recorre por separado
+    start = url_lower.find('//') + 2
+    end = start + len(domain)
+    domain_in_url = url_lower.startswith(domain, start)
+
+    suspicious = set()
+    domain_hits = set()
+    for last, (word, categories) in _KEYWORDS_AC.iter(url_lower):
+        for category in categories:
+            if category == 'suspicious':
+                suspicious.add(word)
+            elif domain_in_url and start <= last - len(word) + 1 and last < end:
+                domain_hits.add(category)
+
+    if not domain_in_url:
+        for _, (word, categories) in _KEYWORDS_AC.iter(domain):
+            domain_hits.update(c for c in categories if c != 'suspicious')
+
+    return len(suspicious), domain_hits
+
+
+def scan_keywords_batch(
+    url_lower: List[str],
+    domain_start: np.ndarray,
+    domain_len: np.ndarray,
+) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    scan_keywords() para todas las URLs con una sola pasada del autómata.
+
+    Las URLs se concatenan en un buffer separado por '\n' (ninguna palabra
+    lo contiene) y cada coincidencia se asigna a su fila por su posición.
+    `domain_start` y `domain_len` ubican el dominio dentro de cada URL.
+
+    Returns:
+        Tuple[np.ndarray, Dict[str, np.ndarray]]: (palabras sospechosas
+        distintas por URL, {categoría: presente en el dominio, por URL})
+    """
+    n = len(url_lower)
+    if _KEYWORDS_AC is None:
+        keywords = [
+            scan_keywords(u, u[start:start + length])
+            for u, start, length in zip(url_lower, domain_start, domain_len)
+        ]
+        suspicious_count = np.fromiter((k[0] for k in keywords), dtype=np.int64, count=n)
+        domain_hits = {
+            category: np.array([category in k[1] for k in keywords], dtype=bool)
+            for category in _KEYWORD_LISTS if category != 'suspicious'
+        }
+        return suspicious_count, domain_hits
+
+    lengths = np.fromiter(map(len, url_lower), dtype=np.int64, count=n)
+    row_start = np.concatenate(([0], np.cumsum(lengths + 1)[:-1]))
+
+    hits = list(_KEYWORDS_AC.iter('\n'.join(url_lower)))
+    last = np.fromiter((h[0] for h in hits), dtype=np.int64, count=len(hits))
+    word = np.fromiter((_KEYWORD_INDEX[h[1][0]] for h in hits), dtype=np.int64, count=len(hits))
+    rows = np.searchsorted(row_start, last, side='right') - 1
+    bits = _KEYWORD_CATEGORY_BITS[word]
+
+    # Posición de cada coincidencia relativa al inicio del dominio de su URL
+    first = last - row_start[rows] - _KEYWORD_LENGTHS[word] + 1 - domain_start[rows]
+    in_domain = (first >= 0) & (first + _KEYWORD_LENGTHS[word] <= domain_len[rows])
+
+    suspicious_count = np.zeros(n, dtype=np.int64)
+    domain_hits = {}
+    for i, category in enumerate(_KEYWORD_LISTS):
+        is_category = ((bits >> i) & 1) == 1
+        if category == 'suspicious':
+            # Palabras distintas: pares (fila, palabra) únicos
+            pairs = np.unique(rows[is_category] * len(_KEYWORD_INDEX) + word[is_category])
+            suspicious_count = np.bincount(pairs // len(_KEYWORD_INDEX), minlength=n)
+        else:
+            found = np.zeros(n, dtype=bool)
+            found[rows[is_category & in_domain]] = True
+            domain_hits[category] = found
+
+    return suspicious_count, domain_hits
+
+
+def analyze_url_mask(
+    url: str,
+    _bits=SIGNAL_BITS,
+    _parse=_fast_parse,
+    _is_ip=is_ip_address,
+    _entropy=calculate_entropy,
+    _scan=scan_keywords,
+    _tld_index=_TLD_INDEX,
+    _unknown_tld=_UNKNOWN_TLD,
+    _entropy_min_length=ENTROPY_MIN_LENGTH,
+) -> Tuple[int, int]:
+    """
+    Aplica las heurísticas a una URL sin construir la lista de señales.
+
+    Los argumentos con guion bajo no se pasan: enlazan globales como
+    variables locales (LOAD_FAST en lugar de LOAD_GLOBAL), porque esta
+    función se ejecuta una vez por URL.
+
+    Returns:
+        Tuple[int, int]: (máscara con un bit por señal de SIGNAL_BITS,
+        cantidad de palabras sospechosas)
+    """
+    url_lower = url.lower().strip()
+    parsed = _parse(url_lower)
+    if parsed is None:
+        return 0, 0
+    scheme, domain = parsed
+
+    # Extraer TLD y subdominios
+    domain_parts = domain.split('.')
+    tld = domain_parts[-1] if domain_parts else ''
+    subdomain_count = len(domain_parts) - 2 if len(domain_parts) > 2 else 0
+    risky_tld, official_suffixes = _tld_index.get(tld, _unknown_tld)
+
+    mask = 0
+
+    # === VERIFICACIONES ===
+
+    # 1. Sin HTTPS
+    if scheme == 'http':
+        mask |= _bits['NO_HTTPS']
+
+    # 2. IP como host
+    if _is_ip(domain):
+        mask |= _bits['IP_AS_HOST']
+
+    # 3. Punycode
+    if 'xn--' in domain:
+        mask |= _bits['PUNYCODE_DETECTED']
+
+    # 4. Subdominios excesivos
+    if subdomain_count > 3:
+        mask |= _bits['EXCESSIVE_SUBDOMAINS']
+
+    # 5. Símbolo @
+    if '@' in url:
+        mask |= _bits['AT_SYMBOL']
+
+    # 6. URL muy larga
+    if len(url) > 100:
+        mask |= _bits['LONG_URL']
+
+    # 7. Alto ratio de dígitos
+    digit_count = sum(c.isdigit() for c in url)
+    digit_ratio = digit_count / len(url) if len(url) > 0 else 0
+    if digit_ratio > 0.3:
+        mask |= _bits['HIGH_DIGIT_RATIO']
+
+    # 8. Muchos guiones
+    hyphen_count = domain.count('-')
+    if hyphen_count > 3:
+        mask |= _bits['MANY_HYPHENS']
+
+    # 9. Alta entropía (solo dominios que pueden superar el umbral)
+    if len(domain) > _entropy_min_length and _entropy(domain) > 4.0:
+        mask |= _bits['HIGH_ENTROPY']
+
+    # Palabras sospechosas, shorteners, typosquatting y marcas: una sola pasada
+    suspicious_count, domain_hits = _scan(url_lower, domain)
+
+    # 10. URL shortener
+    if 'shortener' in domain_hits:
+        mask |= _bits['URL_SHORTENER']
+
+    # 11. TLD riesgoso
+    if risky_tld:
+        mask |= _bits['RISKY_TLD']
+
+    # 12. Palabras sospechosas
+    if suspicious_count > 0:
+        mask |= _bits['SUSPICIOUS_WORDS']
+
+    # 13. Typosquatting
+    if 'typosquatting' in domain_hits:
+        mask |= _bits['TYPOSQUATTING']
+
+    # 14. Impersonación de marca
+    if 'brand' in domain_hits and not domain.endswith(official_suffixes):
+        mask |= _bits['BRAND_IMPERSONATION']
+
+    return mask, suspicious_count
+
+
+def score_from_mask(mask: int, suspicious_count: int) -> int:
+    """Score total (máximo 100) de una máscara de señales."""
+    suspicious_weight = min(WEIGHTS['SUSPICIOUS_WORDS'] * suspicious_count, 25)
+    return min(_MASK_SCORES[mask] + suspicious_weight, 100)
 
 
 def analyze_url_heuristic(url: str) -> Tuple[int, List[Dict]]:
@@ -165,125 +467,182 @@ def analyze_url_heuristic(url: str) -> Tuple[int, List[Dict]]:
     Returns:
         Tuple[int, List[Dict]]: (score, lista de señales)
     """
-    signals = []
+    mask, suspicious_count = analyze_url_mask(url)
 
-    try:
-        url_lower = url.lower().strip()
-        parsed = urlparse(url_lower)
-        domain = parsed.netloc
-        path = parsed.path
-        scheme = parsed.scheme
-
-        # Extraer TLD y subdominios
-        domain_parts = domain.split('.')
-        tld = domain_parts[-1] if domain_parts else ''
-        subdomain_count = len(domain_parts) - 2 if len(domain_parts) > 2 else 0
-
-        # === VERIFICACIONES ===
-
-        # 1. Sin HTTPS
-        if scheme == 'http':
-            signals.append({'id': 'NO_HTTPS', 'weight': WEIGHTS['NO_HTTPS']})
-
-        # 2. IP como host
-        if is_ip_address(domain):
-            signals.append({'id': 'IP_AS_HOST', 'weight': WEIGHTS['IP_AS_HOST']})
-
-        # 3. Punycode
-        if 'xn--' in domain:
-            signals.append({'id': 'PUNYCODE_DETECTED', 'weight': WEIGHTS['PUNYCODE_DETECTED']})
-
-        # 4. Subdominios excesivos
-        if subdomain_count > 3:
-            signals.append({'id': 'EXCESSIVE_SUBDOMAINS', 'weight': WEIGHTS['EXCESSIVE_SUBDOMAINS']})
-
-        # 5. Símbolo @
-        if '@' in url:
-            signals.append({'id': 'AT_SYMBOL', 'weight': WEIGHTS['AT_SYMBOL']})
-
-        # 6. URL muy larga
-        if len(url) > 100:
-            signals.append({'id': 'LONG_URL', 'weight': WEIGHTS['LONG_URL']})
-
-        # 7. Alto ratio de dígitos
-        digit_count = sum(c.isdigit() for c in url)
-        digit_ratio = digit_count / len(url) if len(url) > 0 else 0
-        if digit_ratio > 0.3:
-            signals.append({'id': 'HIGH_DIGIT_RATIO', 'weight': WEIGHTS['HIGH_DIGIT_RATIO']})
-
-        # 8. Muchos guiones
-        hyphen_count = domain.count('-')
-        if hyphen_count > 3:
-            signals.append({'id': 'MANY_HYPHENS', 'weight': WEIGHTS['MANY_HYPHENS']})
-
-        # 9. Alta entropía
-        entropy = calculate_entropy(domain)
-        if entropy > 4.0:
-            signals.append({'id': 'HIGH_ENTROPY', 'weight': WEIGHTS['HIGH_ENTROPY']})
-
-        # 10. URL shortener
-        for shortener in URL_SHORTENERS:
-            if shortener in domain:
-                signals.append({'id': 'URL_SHORTENER', 'weight': WEIGHTS['URL_SHORTENER']})
-                break
-
-        # 11. TLD riesgoso
-        if tld in RISKY_TLDS:
-            signals.append({'id': 'RISKY_TLD', 'weight': WEIGHTS['RISKY_TLD']})
-
-        # 12. Palabras sospechosas
-        suspicious_count = sum(1 for word in SUSPICIOUS_WORDS if word in url_lower)
-        if suspicious_count > 0:
+    signals = []
+    for name in SIGNAL_ORDER:
+        if not mask & SIGNAL_BITS[name]:
+            continue
+        if name == 'SUSPICIOUS_WORDS':
             weight = min(WEIGHTS['SUSPICIOUS_WORDS'] * suspicious_count, 25)
-            signals.append({'id': 'SUSPICIOUS_WORDS', 'weight': weight, 'count': suspicious_count})
+            signals.append({'id': name, 'weight': weight, 'count': suspicious_count})
+        else:
+            signals.append({'id': name, 'weight': WEIGHTS[name]})
 
-        # 13. Typosquatting
-        for pattern in TYPOSQUATTING_PATTERNS:
-            if pattern['pattern'] in domain:
-                signals.append({'id': 'TYPOSQUATTING', 'weight': WEIGHTS['TYPOSQUATTING']})
-                break
+    return score_from_mask(mask, suspicious_count), signals
 
-        # 14. Impersonación de marca
-        for brand in TARGETED_BRANDS:
-            if brand in domain:
-                is_official = any(domain.endswith(d) for d in OFFICIAL_DOMAINS)
-                if not is_official:
-                    signals.append({'id': 'BRAND_IMPERSONATION', 'weight': WEIGHTS['BRAND_IMPERSONATION']})
-                    break
 
-    except Exception as e:
-        logger.warning(f"Error analizando {url}: {e}")
+def predict_label(score: int, threshold: int = 50) -> int:
+    """Predice label basado en score."""
+    return 1 if score >= threshold else 0
 
-    # Calcular score total
-    score = sum(s['weight'] for s in signals)
-    score = min(score, 100)  # Máximo 100
 
-    return score, signals
+def char_counts(urls: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Largo, cantidad de dígitos y presencia de '@' de cada URL.
 
+    Las URLs se concatenan en un buffer de code points (UTF-32) y los
+    conteos por fila salen de sumas acumuladas sobre máscaras NumPy, sin
+    recorrer cada carácter en Python. Las filas con caracteres no ASCII
+    cuentan los dígitos con str.isdigit(), igual que analyze_url_mask().
+    """
+    n = len(urls)
+    lengths = np.fromiter(map(len, urls), dtype=np.int64, count=n)
+    codes = np.frombuffer(''.join(urls).encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+    bounds = np.concatenate(([0], np.cumsum(lengths)))
 
-def predict_label(score: int, threshold: int = 50) -> int:
-    """Predice label basado en score."""
-    return 1 if score >= threshold else 0
+    def per_row(mask: np.ndarray) -> np.ndarray:
+        total = np.concatenate(([0], np.cumsum(mask)))
+        return total[bounds[1:]] - total[bounds[:-1]]
 
+    digits = per_row((codes >= 0x30) & (codes <= 0x39))
+    has_at = per_row(codes == 0x40) > 0
+    for i in np.flatnonzero(per_row(codes > 0x7f)):
+        digits[i] = sum(c.isdigit() for c in urls[i])
 
-def evaluate_on_dataset(df: pd.DataFrame, threshold: int = 50) -> Dict:
-    """Evalúa las heurísticas en un dataset."""
-    logger.info(f"Evaluando {len(df)} URLs con threshold={threshold}...")
+    return lengths, digits, has_at
+
+
+def score_urls(urls: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Equivalente a aplicar analyze_url_heuristic() a cada URL, pero las
+    señales se calculan para toda la columna con los accesores .str de pandas.
 
-    scores = []
-    predictions = []
-    signal_counts = Counter()
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (scores, máscara de señales de cada URL)
+    """
+    urls = pd.Series(urls, dtype=object).fillna('nan').map(str).reset_index(drop=True)
+    # Minúsculas y strip en una sola pasada (una copia por URL, no dos)
+    url_lower = pd.Series([u.lower().strip() for u in urls], dtype=object)
+
+    parts = url_lower.str.extract(_URL_RE)
+    # Los casos especiales de urlparse usan el análisis por fila
+    fallback = parts[1].isna() | url_lower.str.contains(_URLPARSE_ONLY_RE)
+    parts = parts.fillna('')
+    scheme = parts[0]
+    domain = parts[1]
+    length, digits, has_at = char_counts(urls.tolist())
+
+    domain_len = domain.str.len().to_numpy()
+
+    # El dominio empieza justo después de 'scheme://'
+    suspicious_count, domain_hits = scan_keywords_batch(
+        url_lower.tolist(), (scheme.str.len() + 3).to_numpy(), domain_len
+    )
+
+    # Entropía solo de los dominios que pueden superar el umbral
+    high_entropy = np.zeros(len(urls), dtype=bool)
+    candidates = np.flatnonzero(domain_len > ENTROPY_MIN_LENGTH)
+    high_entropy[candidates] = entropy_batch(domain.iloc[candidates].tolist()) > 4.0
+
+    f = {}
+    f['NO_HTTPS'] = scheme == 'http'
+    f['IP_AS_HOST'] = domain.str.split(':', n=1).str[0].str.match(_IP_RE)
+    f['PUNYCODE_DETECTED'] = domain.str.contains('xn--', regex=False)
+    f['EXCESSIVE_SUBDOMAINS'] = domain.str.count(r'\.') > 4
+    f['AT_SYMBOL'] = has_at
+    f['LONG_URL'] = length > 100
+    with np.errstate(invalid='ignore'):
+        f['HIGH_DIGIT_RATIO'] = (digits / length) > 0.3
+    f['MANY_HYPHENS'] = domain.str.count('-') > 3
+    f['HIGH_ENTROPY'] = high_entropy
+    f['URL_SHORTENER'] = domain_hits['shortener']
+    f['RISKY_TLD'] = domain.str.rsplit('.', n=1).str[-1].isin(RISKY_TLDS)
+    f['SUSPICIOUS_WORDS'] = suspicious_count > 0
+    f['TYPOSQUATTING'] = domain_hits['typosquatting']
+    # El dominio oficial solo se compara en las URLs que mencionan una marca
+    impersonation = domain_hits['brand'].copy()
+    brand_rows = np.flatnonzero(impersonation)
+    official = domain.iloc[brand_rows].str.endswith(_OFFICIAL_SUFFIXES).to_numpy(dtype=bool)
+    impersonation[brand_rows] = ~official
+    f['BRAND_IMPERSONATION'] = impersonation
+
+    masks = np.zeros(len(urls), dtype=np.uint32)
+    for name in SIGNAL_ORDER:
+        masks[np.asarray(f[name], dtype=bool)] |= SIGNAL_BITS[name]
+
+    # Pesos fijos por máscara; SUSPICIOUS_WORDS pesa 5 por palabra (máx. 25)
+    suspicious_weight = np.minimum(WEIGHTS['SUSPICIOUS_WORDS'] * suspicious_count, 25)
+    scores = np.minimum(_MASK_SCORES_ARR[masks] + suspicious_weight, 100)
+
+    for i in np.flatnonzero(fallback.to_numpy()):
+        mask, count = analyze_url_mask(urls[i])
+        scores[i] = score_from_mask(mask, count)
+        masks[i] = mask
+
+    return scores, masks
+
+
+def score_urls_parallel(urls: pd.Series, chunk_size: int = 20000) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Igual que score_urls(), repartiendo bloques de `chunk_size` URLs entre
+    todos los núcleos.
+    """
+    if len(urls) <= chunk_size:
+        return score_urls(urls)
+
+    urls = pd.Series(urls).reset_index(drop=True)
+    results = Parallel(n_jobs=os.cpu_count(), backend='loky')(
+        delayed(score_urls)(urls[start:start + chunk_size])
+        for start in range(0, len(urls), chunk_size)
+    )
+    scores, masks = zip(*results)
+    return np.concatenate(scores), np.concatenate(masks)
+
+
+def _score_dataset(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calcula (scores, señales) de todas las URLs del dataset una sola vez.
+
+    Las URLs repetidas se evalúan una vez y el resultado se replica.
+    """
+    codes, uniques = pd.factorize(df['url'], use_na_sentinel=False)
+    logger.info(f"Calculando scores de {len(df)} URLs ({len(uniques)} únicas)...")
+    scores, masks = score_urls_parallel(pd.Series(uniques, dtype=object))
+    return scores[codes], masks[codes]
+
+
+def signal_counts(masks: np.ndarray) -> Counter:
+    """
+    Cuenta en cuántas URLs aparece cada señal a partir de las máscaras.
+
+    Las claves siguen el orden de primera aparición, igual que un Counter
+    llenado URL por URL, para que most_common() desempate de la misma forma.
+    """
+    bits = ((masks[:, None] >> np.arange(len(SIGNAL_ORDER), dtype=np.uint32)) & 1).astype(bool)
+    counts = bits.sum(axis=0)
+    first_row = np.where(counts > 0, bits.argmax(axis=0), len(masks))
+    order = sorted(range(len(SIGNAL_ORDER)), key=lambda j: (first_row[j], j))
+    return Counter({SIGNAL_ORDER[j]: int(counts[j]) for j in order if counts[j]})
+
+
+def evaluate_on_dataset(
+    df: pd.DataFrame,
+    threshold: int = 50,
+    scored: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+) -> Dict:
+    """
+    Evalúa las heurísticas en un dataset.
 
-    for url in df['url']:
-        score, signals = analyze_url_heuristic(str(url))
-        scores.append(score)
-        predictions.append(predict_label(score, threshold))
+    `scored` es el resultado de _score_dataset(df); si se pasa, solo se
+    recalculan las predicciones para el threshold indicado.
+    """
+    logger.info(f"Evaluando {len(df)} URLs con threshold={threshold}...")
 
-        for signal in signals:
-            signal_counts[signal['id']] += 1
+    scores, masks = scored if scored is not None else _score_dataset(df)
 
     y_true = df['label'].values
-    y_pred = np.array(predictions)
+    y_pred = (scores >= threshold).astype(int)
 
     # Métricas
     metrics = {
@@ -312,23 +671,41 @@ def evaluate_on_dataset(df: pd.DataFrame, threshold: int = 50) -> Dict:
     }
 
     # Señales más frecuentes
-    metrics['signal_frequency'] = dict(signal_counts.most_common(15))
+    metrics['signal_frequency'] = dict(signal_counts(masks).most_common(15))
 
     return metrics
 
 
-def find_optimal_threshold(df: pd.DataFrame) -> Tuple[int, Dict]:
-    """Encuentra el threshold óptimo para maximizar F1."""
+def find_optimal_threshold(
+    df: pd.DataFrame,
+    scored: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+) -> Tuple[int, Dict]:
+    """
+    Encuentra el threshold óptimo para maximizar F1.
+
+    precision_recall_curve da precision y recall para cada score observado
+    como threshold (score >= t) con un solo ordenamiento, así que se prueban
+    todos los scores observados entre 20 y 80 y no solo múltiplos de 5.
+    """
     best_threshold = 50
-    best_f1 = 0
     best_metrics = {}
 
-    for threshold in range(20, 81, 5):
-        metrics = evaluate_on_dataset(df, threshold)
-        if metrics['f1_score'] > best_f1:
-            best_f1 = metrics['f1_score']
-            best_threshold = threshold
-            best_metrics = metrics
+    # Los scores no dependen del threshold: se calculan una vez para todo el barrido
+    if scored is None:
+        scored = _score_dataset(df)
+
+    precision, recall, thresholds = precision_recall_curve(df['label'].values, scored[0])
+    # El último punto (precision=1, recall=0) no tiene threshold asociado;
+    # por debajo de 20 el óptimo degenera en marcar casi todo como malicioso
+    in_range = (thresholds >= 20) & (thresholds <= 80)
+    precision = precision[:-1][in_range]
+    recall = recall[:-1][in_range]
+    thresholds = thresholds[in_range]
+    f1 = 2 * precision * recall / np.maximum(precision + recall, 1e-12)
+
+    if len(f1) and f1.max() > 0:
+        best_threshold = int(thresholds[np.argmax(f1)])
+        best_metrics = evaluate_on_dataset(df, best_threshold, scored)
 
     return best_threshold, best_metrics
 
@@ -350,7 +727,7 @@ def main():
         sys.exit(1)
 
     logger.info(f"Cargando datos desde {test_path}")
-    df = pd.read_csv(test_path)
+    df = read_url_labels(test_path)
 
     # Tomar muestra si es muy grande
     if len(df) > 50000:
@@ -360,9 +737,12 @@ def main():
     logger.info(f"URLs a evaluar: {len(df)}")
     logger.info(f"Distribución: {df['label'].value_counts().to_dict()}")
 
+    # Scores de todas las URLs (se reutilizan para cada threshold)
+    scored = _score_dataset(df)
+
     # Evaluar con threshold por defecto
     logger.info("\n--- Evaluación con threshold=50 ---")
-    metrics_50 = evaluate_on_dataset(df, threshold=50)
+    metrics_50 = evaluate_on_dataset(df, threshold=50, scored=scored)
 
     logger.info(f"Accuracy: {metrics_50['accuracy']:.4f}")
     logger.info(f"Precision: {metrics_50['precision']:.4f}")
@@ -371,7 +751,7 @@ def main():
 
     # Encontrar threshold óptimo
     logger.info("\n--- Buscando threshold óptimo ---")
-    optimal_threshold, optimal_metrics = find_optimal_threshold(df)
+    optimal_threshold, optimal_metrics = find_optimal_threshold(df, scored)
 
     logger.info(f"Threshold óptimo: {optimal_threshold}")
     logger.info(f"F1-Score óptimo: {optimal_metrics['f1_score']:.4f}")
@@ -379,7 +759,7 @@ def main():
     # Evaluar con diferentes thresholds
     threshold_results = {}
     for threshold in [30, 40, 50, 60, 70]:
-        metrics = evaluate_on_dataset(df, threshold)
+        metrics = evaluate_on_dataset(df, threshold, scored)
         threshold_results[threshold] = {
             'precision': metrics['precision'],
             'recall': metrics['recall'],